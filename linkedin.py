@@ -7,12 +7,16 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 
 import os
 import json
+import asyncio
 import jmespath
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List
 from urllib.parse import urlencode, quote_plus
 from parsel import Selector
+from requests.adapters import HTTPAdapter
 from loguru import logger as log
 from scrapfly import ScrapeConfig, ScrapflyClient, ScrapeApiResponse
+from scrapfly.errors import TooManyConcurrentRequest, TooManyRequest
 from dotenv import load_dotenv
 
 # Add these two lines to load .env file
@@ -20,6 +24,25 @@ load_dotenv()
 
 SCRAPFLY = ScrapflyClient(key=os.environ["SCRAPFLY_KEY"])
 
+
+def get_client(concurrency: int = None) -> ScrapflyClient:
+    """
+    return the shared scrapfly client, use it as a context manager (`with get_client():`)
+    to keep one HTTP session open across scrape calls instead of reconnecting for each request.
+    scrapfly runs every async scrape in a worker thread, pass the concurrency to size its thread pool
+    and its HTTP connection pool to it
+    """
+    if concurrency:
+        if SCRAPFLY.async_executor is not None:
+            SCRAPFLY.async_executor.shutdown(wait=False)
+        SCRAPFLY.async_executor = ThreadPoolExecutor(max_workers=concurrency)
+        # requests keeps only 10 connections per host by default, more concurrent requests would reconnect.
+        # `with` keeps the session opened here
+        SCRAPFLY.open()
+        SCRAPFLY.http_session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+    return SCRAPFLY
+
+
 BASE_CONFIG = {
     # bypass linkedin.com web scraping blocking
     "asp": True,
@@ -32,6 +55,9 @@ BASE_CONFIG = {
     "proxy_pool": "public_residential_pool"    
 }
 
+# scrapfly errors returned when the plan's rate or concurrency limit is hit
+RATE_LIMIT_ERRORS = (TooManyConcurrentRequest, TooManyRequest)
+
 def refine_profile(data: Dict) -> Dict: 
     """refine and clean the parsed profile data"""
     parsed_data = {}
@@ -51,19 +77,44 @@ def parse_profile(response: ScrapeApiResponse) -> Dict:
     return refined_data
 
 
-async def scrape_profile(urls: List[str]) -> List[Dict]:
-    """scrape public linkedin profile pages"""
-    to_scrape = [ScrapeConfig(url, **BASE_CONFIG) for url in urls]
+async def scrape_with_backoff(
+    config: ScrapeConfig, semaphore: asyncio.Semaphore, client: ScrapflyClient = SCRAPFLY, max_retries: int = 5
+) -> ScrapeApiResponse:
+    """scrape a single page, backing off exponentially when scrapfly rate limits it"""
+    for attempt in range(max_retries + 1):
+        async with semaphore:
+            try:
+                return await client.async_scrape(config)
+            except RATE_LIMIT_ERRORS:
+                if attempt == max_retries:
+                    raise
+        # only this request waits, other requests keep using the free slots
+        delay = 2 ** attempt
+        log.warning(f"rate limited while scraping {config.url}, retrying in {delay} seconds")
+        await asyncio.sleep(delay)
+
+
+async def scrape_profile(urls: List[str], concurrency: int = None, client: ScrapflyClient = SCRAPFLY) -> List[Dict]:
+    """
+    scrape public linkedin profile pages
+    the results are in the same order as the URLs, with None in place of each profile that failed
+    """
+    semaphore = asyncio.Semaphore(concurrency or client.max_concurrency)
+    to_scrape = [scrape_with_backoff(ScrapeConfig(url, **BASE_CONFIG), semaphore, client) for url in urls]
     data = []
-    # scrape the URLs concurrently
-    async for response in SCRAPFLY.concurrent_scrape(to_scrape):
+    # scrape the URLs concurrently, gather keeps the input order
+    for url, response in zip(urls, await asyncio.gather(*to_scrape, return_exceptions=True)):
+        if isinstance(response, Exception):
+            log.error("An error occured while scraping profile page {}: {}", url, response)
+            data.append(None)
+            continue
         try:
             profile_data = parse_profile(response)
             data.append(profile_data)
         except Exception as e:
-            log.error("An occured while scraping profile pages", e)
-            pass
-    log.success(f"scraped {len(data)} profiles from Linkedin")
+            log.error("An error occured while parsing profile page {}: {}", url, e)
+            data.append(None)
+    log.success(f"scraped {sum(1 for item in data if item)} profiles from Linkedin")
     return data
 
 
@@ -7,10 +7,9 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
 import asyncio
-import json
 from pathlib import Path
 import linkedin
-from utils import save_jsonl
+from utils import dumps_json, save_jsonl
 
 output = Path(__file__).parent / "results"
 output.mkdir(exist_ok=True)
@@ -26,8 +25,9 @@ async def run():
     print("running Linkedin scrape and saving results to ./results directory")
 
     profile_data = await linkedin.scrape_profile(urls=["https://www.linkedin.com/in/williamhgates"])
-    with open(output.joinpath("profile.json"), "w", encoding="utf-8") as file:
-        json.dump(profile_data, file, indent=2, ensure_ascii=False)
+    # failed profiles are returned as None placeholders
+    profile_data = [profile for profile in profile_data if profile]
+    output.joinpath("profile.json").write_bytes(dumps_json(profile_data, indent=True))
     save_jsonl(profile_data, data_output, prefix="profile")
 
     company_data = await linkedin.scrape_company(
@@ -37,8 +37,7 @@ async def run():
             "https://linkedin.com/company/apple",
         ]
     )
-    with open(output.joinpath("company.json"), "w", encoding="utf-8") as file:
-        json.dump(company_data, file, indent=2, ensure_ascii=False)
+    output.joinpath("company.json").write_bytes(dumps_json(company_data, indent=True))
     save_jsonl(company_data, data_output, prefix="company")
 
     job_search_data = await linkedin.scrape_job_search(
@@ -47,8 +46,7 @@ async def run():
         location="United States",
         max_pages=3,
     )
-    with open(output.joinpath("job_search.json"), "w", encoding="utf-8") as file:
-        json.dump(job_search_data, file, indent=2, ensure_ascii=False)
+    output.joinpath("job_search.json").write_bytes(dumps_json(job_search_data, indent=True))
     save_jsonl(job_search_data, data_output, prefix="job_search")
 
     job_data = await linkedin.scrape_jobs(
@@ -58,8 +56,7 @@ async def run():
             "https://www.linkedin.com/jobs/view/sr-content-marketing-manager-brand-protection-brand-protection-at-amazon-4007942181",
         ]
     )
-    with open(output.joinpath("jobs.json"), "w", encoding="utf-8") as file:
-        json.dump(job_data, file, indent=2, ensure_ascii=False)
+    output.joinpath("jobs.json").write_bytes(dumps_json(job_data, indent=True))
     save_jsonl(job_data, data_output, prefix="jobs")
 
     artcile_data = await linkedin.scrape_articles(
@@ -69,10 +66,11 @@ async def run():
             "https://www.linkedin.com/pulse/world-has-lot-learn-from-india-bill-gates-vaubc",
         ]
     )
-    with open(output.joinpath("articles.json"), "w", encoding="utf-8") as file:
-        json.dump(artcile_data, file, indent=2, ensure_ascii=False)
+    output.joinpath("articles.json").write_bytes(dumps_json(artcile_data, indent=True))
     save_jsonl(artcile_data, data_output, prefix="articles")
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    # reuse one scrapfly HTTP session for all the example scrapes
+    with linkedin.get_client():
+        asyncio.run(run())
@@ -14,13 +14,19 @@ $ export $SCRAPFLY_KEY="your key from https://scrapfly.io/dashboard"
 """
 
 import asyncio
-import json
 import csv
+import os
+import threading
 import time
+from collections import Counter
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict
+from typing import List
+import msgspec
 import linkedin
 from loguru import logger as log
+from scrapfly import ScrapflyClient
+from utils import dumps_json
 
 # Setup output directories
 output = Path(__file__).parent / "results"
@@ -28,183 +34,353 @@ output.mkdir(exist_ok=True)
 data_output = Path(__file__).parent / "data_source"
 data_output.mkdir(exist_ok=True)
 
-def read_csv_profiles(csv_file: str) -> List[Dict]:
+# Maximum number of concurrent scrape requests, set it to your Scrapfly plan's concurrency limit
+SCRAPE_CONCURRENCY = int(os.getenv("SCRAPE_CONCURRENCY", "10"))
+# Profiles scraped per batch, larger batches amortize the per-batch overhead up to the concurrency limit
+# For Scrapfly Pro concurrency=100, use batch_size=100
+SCRAPE_BATCH_SIZE = int(os.getenv("SCRAPE_BATCH_SIZE", "50"))
+# Maximum number of records per JSONL file
+SCRAPE_CHUNK_SIZE = int(os.getenv("SCRAPE_CHUNK_SIZE", "100000"))
+
+@dataclass(slots=True)
+class Profile:
+    """A LinkedIn profile row from the input CSV file"""
+    name: str
+    linkedin_url: str
+    search_keyword: str
+    profession: str
+
+def read_csv_profiles(csv_file: str) -> List[Profile]:
     """Read LinkedIn profile URLs from CSV file"""
     profiles = []
     try:
         with open(csv_file, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:  # empty file
+                log.success("Loaded 0 profiles from CSV file")
+                return profiles
+            # Resolve the column positions once from the header row
+            columns = [header.index(column) for column in ("name", "linkedin_url", "search_keyword", "profession")]
+            name_i, url_i, kw_i, prof_i = columns
+            min_length = max(columns) + 1
             for row in reader:
-                # Ensure all values are properly formatted strings
-                profiles.append({
-                    "name": str(row["name"]).strip(),
-                    "linkedin_url": str(row["linkedin_url"]).strip(),
-                    "search_keyword": str(row["search_keyword"]).strip(),
-                    "profession": str(row["profession"]).strip()
-                })
+                if not row:  # skip blank lines like csv.DictReader does
+                    continue
+                if len(row) < min_length:
+                    log.warning(f"Skipping incomplete row on line {reader.line_num}: {row}")
+                    continue
+                profiles.append(Profile(
+                    row[name_i].strip(),
+                    row[url_i].strip(),
+                    row[kw_i].strip(),
+                    row[prof_i].strip()
+                ))
         log.success(f"Loaded {len(profiles)} profiles from CSV file")
         return profiles
     except Exception as e:
         log.error(f"Error reading CSV file: {e}")
         return []
 
-def validate_jsonl_record(record: Dict) -> bool:
-    """Validate that a record follows JSONL protocol"""
-    try:
-        # Test that the record can be serialized to JSON
-        json_str = json.dumps(record, ensure_ascii=False)
-        # Test that it can be deserialized back
-        json.loads(json_str)
-        return True
-    except Exception:
-        return False
+class ScrapedRecord(msgspec.Struct):
+    """A scraped profile as written to one JSONL line"""
+    original_profile: Profile
+    scraped_data: dict
+    scraping_timestamp: float
+    batch_number: int
+    record_index: int
+
+# Reusable codecs, decoding validates the record structure and field types
+RECORD_ENCODER = msgspec.json.Encoder()
+RECORD_DECODER = msgspec.json.Decoder(ScrapedRecord)
+
+def list_chunk_files(output_dir: Path, prefix: str) -> List[Path]:
+    """List the numbered {prefix}_NNN.jsonl chunk files, other files like {prefix}_backup.jsonl are not records"""
+    return sorted(chunk_file for chunk_file in Path(output_dir).glob(f"{prefix}_*.jsonl")
+                  if chunk_file.stem[len(prefix) + 1:].isdigit())
 
 class IncrementalJSONLSaver:
     """Handles incremental saving of scraped data to JSONL files"""
     
-    def __init__(self, output_dir: Path, prefix: str = "linkedin_profiles", chunk_size: int = 100000):
+    # Records are buffered and written to the file descriptor in writes of about this size
+    buffer_size = 1 << 20
+    
+    def __init__(self, output_dir: Path, prefix: str = "linkedin_profiles", chunk_size: int = 100000,
+                 flush_every: int = 1000, resume: bool = True):
+        if chunk_size < 1 or flush_every < 1:
+            raise ValueError(f"chunk_size and flush_every must be at least 1, got {chunk_size} and {flush_every}")
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.prefix = prefix
         self.chunk_size = chunk_size
+        self.flush_every = flush_every
         self.current_chunk = 1
         self.current_file_records = 0
         self.total_records_saved = 0
+        self.profession_counts = Counter()
+        self.seen_urls = set()
+        # (file name, line number) of invalid lines found when resuming, e.g. a record cut short by a crash
+        self.invalid_lines = set()
         self.current_file_path = None
-        self.current_file_handle = None
+        self._file_list = []
+        self.current_fd = None
+        self.buffer = bytearray()
+        # (end offset in buffer, profile) of the buffered records, counted as saved once written to disk
+        self._pending = []
+        # save_records runs in a worker thread, close() must not interleave with it
+        self._lock = threading.Lock()
+        self.closed = False
         
-        # Start the first file
-        self._start_new_file()
+        # Pick up the files of a previous run, new records go to the next chunk file
+        if resume:
+            self._load_existing_files()
+        elif list_chunk_files(self.output_dir, self.prefix):
+            raise FileExistsError(f"{self.output_dir} already contains {self.prefix} files, "
+                                  f"resume from them or move them away")
+    
+    def _load_existing_files(self):
+        """Load the profiles saved in existing JSONL files so they are not scraped again"""
+        for chunk_file in list_chunk_files(self.output_dir, self.prefix):
+            chunk_number = int(chunk_file.stem[len(self.prefix) + 1:])
+            self.current_chunk = max(self.current_chunk, chunk_number + 1)
+            self._file_list.append(chunk_file.name)
+            
+            with open(chunk_file, "rb", buffering=1 << 20) as f:
+                for line_num, line in enumerate(f, 1):
+                    if line.isspace():
+                        continue
+                    # Same validation as verify_jsonl_integrity so both agree on which lines are records
+                    try:
+                        profile = RECORD_DECODER.decode(line).original_profile
+                    except msgspec.DecodeError as e:
+                        log.warning(f"Skipping invalid record in {chunk_file.name}:{line_num}: {e}")
+                        self.invalid_lines.add((chunk_file.name, line_num))
+                        continue
+                    self.seen_urls.add(profile.linkedin_url)
+                    self.profession_counts[profile.profession] += 1
+                    self.total_records_saved += 1
+        
+        if self.total_records_saved:
+            log.info(f"Resuming with {self.total_records_saved} records already saved "
+                     f"across {len(self._file_list)} files")
     
     def _start_new_file(self):
         """Start a new JSONL file"""
-        if self.current_file_handle:
-            self.current_file_handle.close()
+        self._close_file()
         
         filename = f"{self.prefix}_{self.current_chunk:03d}.jsonl"
         self.current_file_path = self.output_dir / filename
-        self.current_file_handle = open(self.current_file_path, "w", encoding="utf-8")
+        # Exclusive create, never clobber a chunk file left by another run: FileExistsError stops the run
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+        self.current_fd = os.open(self.current_file_path, flags, 0o644)
+        self._file_list.append(filename)
         self.current_file_records = 0
-        
-        log.info(f"Started new file: {filename}")
     
-    def save_record(self, record: Dict) -> bool:
-        """Save a single record to the current JSONL file"""
-        try:
-            # Validate the record
-            if not validate_jsonl_record(record):
-                log.warning(f"Invalid JSONL record, skipping")
-                return False
-            
-            # Check if we need to start a new file
-            if self.current_file_records >= self.chunk_size:
-                log.info(f"File limit reached ({self.chunk_size} records), starting new file")
-                self._start_new_file()
-                self.current_chunk += 1
-            
-            # Write the record to the current file
-            json_line = json.dumps(record, ensure_ascii=False)
-            self.current_file_handle.write(json_line + "\n")
-            self.current_file_handle.flush()  # Ensure data is written immediately
-            
-            self.current_file_records += 1
+    def _flush(self):
+        """Write the buffered records to the current file"""
+        while self.buffer:
+            written = os.write(self.current_fd, self.buffer)
+            # Drop what reached the file right away so a later failed write never repeats it,
+            # and only count the records that were written completely
+            self._commit(written)
+            del self.buffer[:written]
+    
+    def _commit(self, written: int):
+        """Count the buffered records that ended within the first `written` bytes as saved"""
+        committed = 0
+        for end, profile in self._pending:
+            if end > written:
+                break
             self.total_records_saved += 1
-            
-            return True
-            
-        except Exception as e:
-            log.error(f"Error saving record: {e}")
-            return False
+            self.profession_counts[profile.profession] += 1
+            self.seen_urls.add(profile.linkedin_url)
+            committed += 1
+        self._pending = [(end - written, profile) for end, profile in self._pending[committed:]]
+    
+    def _close_file(self):
+        """Flush and close the current file, if any"""
+        if self.current_fd is not None:
+            try:
+                self._flush()
+            finally:
+                os.close(self.current_fd)
+                self.current_fd = None
+    
+    def save_record(self, record: ScrapedRecord) -> bool:
+        """Save a single record to the current JSONL file"""
+        return self.save_records([record]) == 1
+    
+    def save_records(self, records: List[ScrapedRecord]) -> int:
+        """
+        Save a batch of records with a single write per chunk file, returns the number saved.
+        Records are buffered and only counted in total_records_saved once written to disk,
+        write errors are raised so the run doesn't continue with unsaved records.
+        """
+        # Serializing the record is the validation: anything that can't be encoded is skipped
+        lines = []
+        saved_profiles = []
+        for record in records:
+            try:
+                lines.append(RECORD_ENCODER.encode(record))
+            except (TypeError, ValueError, msgspec.EncodeError) as e:
+                log.warning(f"Invalid JSONL record, skipping: {e}")
+                continue
+            saved_profiles.append(record.original_profile)
+        
+        saved = 0
+        with self._lock:
+            while saved < len(lines):
+                # Check if we need to start a new file
+                if self.current_fd is None:
+                    self._start_new_file()
+                elif self.current_file_records >= self.chunk_size:
+                    log.info(f"File limit reached ({self.chunk_size} records), starting new file")
+                    self.current_chunk += 1
+                    self._start_new_file()
+                
+                # Buffer as many records as fit in the current file in one go
+                part = lines[saved:saved + self.chunk_size - self.current_file_records]
+                end = len(self.buffer)
+                for line, profile in zip(part, saved_profiles[saved:saved + len(part)]):
+                    end += len(line) + 1
+                    self._pending.append((end, profile))
+                self.buffer += b"\n".join(part)
+                self.buffer += b"\n"
+                
+                flushes_before = self.current_file_records // self.flush_every
+                self.current_file_records += len(part)
+                saved += len(part)
+                
+                # Flush once the buffer is full or periodically for crash recovery; close() flushes the remainder
+                if (len(self.buffer) >= self.buffer_size
+                        or self.current_file_records // self.flush_every > flushes_before):
+                    self._flush()
+        
+        return saved
     
     def close(self):
-        """Close the current file and finalize"""
-        if self.current_file_handle:
-            self.current_file_handle.close()
-            self.current_file_handle = None
+        """Close the current file and finalize, closing an already closed saver does nothing"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self._close_file()
             
-        log.success(f"Saved {self.total_records_saved} total records across {self.current_chunk} files")
+        log.success(f"Saved {self.total_records_saved} total records across {len(self._file_list)} files")
     
     def get_file_info(self):
         """Get information about created files"""
-        files = list(self.output_dir.glob(f"{self.prefix}_*.jsonl"))
         return {
-            "total_files": len(files),
+            "total_files": len(self._file_list),
             "total_records": self.total_records_saved,
-            "files": sorted([f.name for f in files])
+            "files": sorted(self._file_list)
         }
 
-async def scrape_profiles_in_batches(profiles: List[Dict], saver: IncrementalJSONLSaver, batch_size: int = 10) -> int:
+async def scrape_profiles_in_batches(profiles: List[Profile], saver: IncrementalJSONLSaver,
+                                     batch_size: int = SCRAPE_BATCH_SIZE,
+                                     concurrency: int = SCRAPE_CONCURRENCY,
+                                     client: ScrapflyClient = None) -> int:
     """Scrape profiles in batches and save incrementally"""
+    if batch_size < 1 or concurrency < 1:
+        raise ValueError(f"batch_size and concurrency must be at least 1, got {batch_size} and {concurrency}")
+    client = client or linkedin.get_client(concurrency)
     total_profiles = len(profiles)
+    total_batches = (total_profiles + batch_size - 1) // batch_size
     successful_scrapes = 0
+    # The previous batch is written while the next one is being scraped
+    write_task = None
     
     log.info(f"Starting to scrape {total_profiles} profiles in batches of {batch_size}")
     
-    for i in range(0, total_profiles, batch_size):
-        batch = profiles[i:i + batch_size]
-        batch_urls = [profile["linkedin_url"] for profile in batch]
-        
-        log.info(f"Scraping batch {i//batch_size + 1}/{(total_profiles + batch_size - 1)//batch_size} "
-                f"({len(batch)} profiles)")
-        
-        try:
-            # Scrape the batch
-            scraped_data = await linkedin.scrape_profile(batch_urls)
+    try:
+        for i in range(0, total_profiles, batch_size):
+            batch = profiles[i:i + batch_size]
+            batch_urls = [profile.linkedin_url for profile in batch]
+            batch_number = i // batch_size + 1
             
-            # Process and save each scraped profile immediately
-            batch_success_count = 0
-            for j, profile_data in enumerate(scraped_data):
-                if profile_data:  # Only process if scraping was successful
-                    # Create atomic record following JSONL protocol
-                    combined_data = {
-                        "original_profile": batch[j],
-                        "scraped_data": profile_data,
-                        "scraping_timestamp": time.time(),
-                        "batch_number": i//batch_size + 1,
-                        "record_index": i + j
-                    }
-                    
-                    # Save the record immediately
-                    if saver.save_record(combined_data):
-                        batch_success_count += 1
-                        successful_scrapes += 1
+            # Log progress for every batch on small runs, only the first, last and every 10th batch on large ones
+            if total_batches <= 10 or batch_number in (1, total_batches) or batch_number % 10 == 0:
+                log.info("Scraping batch {}/{} ({} profiles, {} saved so far)",
+                         batch_number, total_batches, len(batch), successful_scrapes)
             
-            log.success(f"Successfully scraped and saved {batch_success_count} profiles from batch")
+            # Scrape the batch, finishing the previous batch's write in the meantime
+            scrape_task = asyncio.create_task(
+                linkedin.scrape_profile(batch_urls, concurrency=concurrency, client=client)
+            )
+            if write_task is not None:
+                # Shielded so an interrupt doesn't abandon a write already running in its thread,
+                # a failed write stops the run instead of silently dropping batches
+                try:
+                    successful_scrapes += await asyncio.shield(write_task)
+                except BaseException:
+                    scrape_task.cancel()
+                    raise
+                write_task = None
             
-            # Add a small delay between batches to be respectful to the API
-            if i + batch_size < total_profiles:
-                log.info("Waiting 2 seconds before next batch...")
-                await asyncio.sleep(2)
-                
-        except Exception as e:
-            log.error(f"Error scraping batch {i//batch_size + 1}: {e}")
-            continue
+            try:
+                scraped_data = await scrape_task
+            except Exception as e:
+                log.error(f"Error scraping batch {batch_number}: {e}")
+                continue
+            
+            # Create atomic records following JSONL protocol and save the whole batch at once
+            scraping_timestamp = time.time()
+            batch_records = [
+                ScrapedRecord(
+                    original_profile=batch[j],
+                    scraped_data=profile_data,
+                    scraping_timestamp=scraping_timestamp,
+                    batch_number=batch_number,
+                    record_index=i + j
+                )
+                for j, profile_data in enumerate(scraped_data)
+                if profile_data  # Only process if scraping was successful
+            ]
+            # Save off the event loop so serialization and disk writes don't block the next scrape
+            write_task = asyncio.create_task(asyncio.to_thread(saver.save_records, batch_records))
+        
+        if write_task is not None:
+            successful_scrapes += await asyncio.shield(write_task)
+            write_task = None
+    
+    finally:
+        # Let a pending write finish before the caller closes the saver
+        if write_task is not None:
+            await asyncio.gather(write_task, return_exceptions=True)
     
     log.success(f"Completed scraping. Total successful scrapes: {successful_scrapes}/{total_profiles}")
     return successful_scrapes
 
-def verify_jsonl_integrity(output_dir: Path, prefix: str, expected_total: int):
-    """Verify that all JSONL files are valid and contain the expected number of records"""
+def verify_jsonl_integrity(output_dir: Path, prefix: str, expected_total: int, known_invalid_lines=()):
+    """
+    Verify that all JSONL files are valid and contain the expected number of records.
+    known_invalid_lines are (file name, line number) pairs already reported and skipped when resuming,
+    they are reported again but don't fail the check.
+    """
     log.info("Verifying JSONL file integrity...")
     
     total_lines = 0
-    chunk_files = list(output_dir.glob(f"{prefix}_*.jsonl"))
+    # Same file selection as resuming, so both count the same records
+    chunk_files = list_chunk_files(output_dir, prefix)
     
-    for chunk_file in sorted(chunk_files):
+    for chunk_file in chunk_files:
         chunk_lines = 0
         try:
-            with open(chunk_file, "r", encoding="utf-8") as f:
+            with open(chunk_file, "rb", buffering=1 << 20) as f:
                 for line_num, line in enumerate(f, 1):
-                    line = line.strip()
-                    if line:  # Skip empty lines
-                        # Verify each line is valid JSON
-                        json.loads(line)
-                        chunk_lines += 1
-                        
-                        # Verify line starts with { and ends with }
-                        if not (line.startswith("{") and line.endswith("}")):
-                            log.error(f"Invalid JSONL format in {chunk_file}:{line_num}")
-                            raise ValueError(f"Line {line_num} is not a complete JSON object")
+                    if line.isspace():  # Skip empty lines
+                        continue
+                    
+                    # Verify each line is a complete record with the expected fields and types
+                    try:
+                        RECORD_DECODER.decode(line)
+                    except msgspec.DecodeError as e:
+                        if (chunk_file.name, line_num) in known_invalid_lines:
+                            log.warning(f"Ignoring invalid record from a previous run in {chunk_file}:{line_num}")
+                            continue
+                        log.error(f"Invalid JSONL format in {chunk_file}:{line_num}")
+                        raise ValueError(f"Line {line_num} is not a valid record: {e}") from e
+                    chunk_lines += 1
             
             total_lines += chunk_lines
             log.success(f"Verified {chunk_file.name}: {chunk_lines} valid records")
@@ -237,16 +413,29 @@ async def main():
         print("No profiles found in CSV file. Exiting.")
         return
     
-    # Initialize the incremental saver
-    saver = IncrementalJSONLSaver(data_output, prefix="linkedin_profiles", chunk_size=100000)
+    # Initialize the incremental saver, picking up the profiles saved by previous runs
+    saver = IncrementalJSONLSaver(data_output, prefix="linkedin_profiles", chunk_size=SCRAPE_CHUNK_SIZE)
+    
+    # Skip the profiles that were already scraped
+    pending_profiles = [profile for profile in profiles if profile.linkedin_url not in saver.seen_urls]
+    previously_scraped = len(profiles) - len(pending_profiles)
+    if previously_scraped:
+        log.info(f"Skipping {previously_scraped} profiles already scraped by a previous run")
+    if not pending_profiles:
+        print("All profiles in the CSV file have already been scraped. Exiting.")
+        return
     
     try:
         # Scrape all profiles with incremental saving
         start_time = time.time()
-        successful_scrapes = await scrape_profiles_in_batches(profiles, saver, batch_size=10)
+        # Keep a single scrapfly client and HTTP session open for all batches
+        client = linkedin.get_client(SCRAPE_CONCURRENCY)
+        with client:
+            successful_scrapes = await scrape_profiles_in_batches(pending_profiles, saver,
+                                                                  batch_size=SCRAPE_BATCH_SIZE, client=client)
         end_time = time.time()
         
-        # Close the saver to finalize files
+        # Close the saver to flush and finalize files
         saver.close()
         
         if successful_scrapes > 0:
@@ -254,36 +443,26 @@ async def main():
             file_info = saver.get_file_info()
             
             # Verify data integrity
-            verify_jsonl_integrity(data_output, "linkedin_profiles", successful_scrapes)
+            verify_jsonl_integrity(data_output, "linkedin_profiles", saver.total_records_saved,
+                                   known_invalid_lines=saver.invalid_lines)
             
             # Create summary statistics
             summary = {
                 "total_profiles_in_csv": len(profiles),
+                "previously_scraped": previously_scraped,
                 "successfully_scraped": successful_scrapes,
-                "success_rate": f"{(successful_scrapes / len(profiles) * 100):.2f}%",
+                "success_rate": f"{(successful_scrapes / len(pending_profiles) * 100):.2f}%",
                 "scraping_time_seconds": round(end_time - start_time, 2),
-                "professions_breakdown": {},
+                "professions_breakdown": dict(saver.profession_counts),
                 "jsonl_files_created": file_info
             }
             
-            # Count professions (we need to read the files to get this info)
-            profession_counts = {}
-            for file_path in data_output.glob("linkedin_profiles_*.jsonl"):
-                with open(file_path, "r", encoding="utf-8") as f:
-                    for line in f:
-                        if line.strip():
-                            record = json.loads(line)
-                            profession = record["original_profile"]["profession"]
-                            profession_counts[profession] = profession_counts.get(profession, 0) + 1
-            
-            summary["professions_breakdown"] = profession_counts
-            
             # Save summary
-            with open(output.joinpath("scraping_summary.json"), "w", encoding="utf-8") as file:
-                json.dump(summary, file, indent=2, ensure_ascii=False)
+            output.joinpath("scraping_summary.json").write_bytes(dumps_json(summary, indent=True))
             
             print(f"\nScraping completed successfully!")
             print(f"Total profiles in CSV: {len(profiles)}")
+            print(f"Previously scraped: {previously_scraped}")
             print(f"Successfully scraped: {successful_scrapes}")
             print(f"Success rate: {summary['success_rate']}")
             print(f"Time taken: {summary['scraping_time_seconds']} seconds")
@@ -296,7 +475,8 @@ async def main():
         else:
             print("No profiles were successfully scraped.")
             
-    except KeyboardInterrupt:
+    # asyncio.run() delivers Ctrl+C to this coroutine as a cancellation
+    except (KeyboardInterrupt, asyncio.CancelledError):
         log.warning("Scraping interrupted by user. Saving current progress...")
         saver.close()
         print("Current progress has been saved. You can resume from where you left off.")
@@ -305,6 +485,10 @@ async def main():
         log.error(f"Unexpected error during scraping: {e}")
         saver.close()
         print("Error occurred, but current progress has been saved.")
+    
+    finally:
+        # Flush whatever is still buffered however the run ends
+        saver.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
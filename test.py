@@ -1,9 +1,11 @@
+import asyncio
 import json
 import os
 from pathlib import Path
 from cerberus import Validator as _Validator
 import pytest
 import linkedin
+import scrape_all_profiles
 import pprint
 
 pp = pprint.PrettyPrinter(indent=4)
@@ -132,6 +134,8 @@ async def test_profile_scraping():
             "https://www.linkedin.com/in/williamhgates"
         ]
     )
+    # failed profiles are returned as None placeholders
+    profile_data = [item for item in profile_data if item]
     validator = Validator(profile_schema, allow_unknown=True)
     for item in profile_data:
         validate_or_fail(item, validator)
@@ -236,4 +240,115 @@ async def test_article_scraping():
     if os.getenv("SAVE_TEST_RESULTS") == "true":
         (Path(__file__).parent / 'results/articles.json').write_text(
             json.dumps(article_data, indent=2, ensure_ascii=False, default=str)
-        )
\ No newline at end of file
+        )
+
+
+def make_profile(index):
+    return scrape_all_profiles.Profile(f"name {index}", f"https://www.linkedin.com/in/{index}", "keyword", "profession")
+
+
+def make_record(index):
+    return scrape_all_profiles.ScrapedRecord(
+        original_profile=make_profile(index),
+        scraped_data={"profile": {"index": index}},
+        scraping_timestamp=1.0,
+        batch_number=1,
+        record_index=index,
+    )
+
+
+def read_lines(path):
+    return path.read_bytes().splitlines()
+
+
+def test_saver_chunk_rollover(tmp_path):
+    saver = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", chunk_size=3, flush_every=2)
+    assert saver.save_records([make_record(i) for i in range(5)]) == 5
+    assert saver.save_record(make_record(5))
+    assert saver.save_records([make_record(6)]) == 1
+    saver.close()
+
+    assert saver.get_file_info()["files"] == ["test_001.jsonl", "test_002.jsonl", "test_003.jsonl"]
+    assert [len(read_lines(tmp_path / name)) for name in saver.get_file_info()["files"]] == [3, 3, 1]
+    assert saver.total_records_saved == 7
+    scrape_all_profiles.verify_jsonl_integrity(tmp_path, "test", 7)
+
+
+def test_saver_counts_records_once_written(tmp_path):
+    saver = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", flush_every=1000)
+    saver.save_records([make_record(i) for i in range(3)])
+    # still buffered in memory
+    assert saver.total_records_saved == 0
+    assert (tmp_path / "test_001.jsonl").read_bytes() == b""
+    saver.close()
+    assert saver.total_records_saved == 3
+    assert len(read_lines(tmp_path / "test_001.jsonl")) == 3
+
+
+def test_saver_resume_after_partial_file(tmp_path):
+    saver = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", chunk_size=2)
+    saver.save_records([make_record(i) for i in range(3)])
+    saver.close()
+    # a crash mid-write leaves a truncated last line
+    with open(tmp_path / "test_002.jsonl", "ab") as f:
+        f.write(scrape_all_profiles.RECORD_ENCODER.encode(make_record(3))[:40])
+
+    resumed = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", chunk_size=2)
+    assert resumed.total_records_saved == 3
+    assert resumed.seen_urls == {make_profile(i).linkedin_url for i in range(3)}
+    assert resumed.invalid_lines == {("test_002.jsonl", 2)}
+    assert resumed.save_record(make_record(3))
+    resumed.close()
+
+    # new records go to a new chunk file, the partial one is left untouched
+    assert len(read_lines(tmp_path / "test_003.jsonl")) == 1
+    assert resumed.total_records_saved == 4
+    scrape_all_profiles.verify_jsonl_integrity(tmp_path, "test", 4, known_invalid_lines=resumed.invalid_lines)
+    with pytest.raises(ValueError):
+        scrape_all_profiles.verify_jsonl_integrity(tmp_path, "test", 4)
+
+
+def test_resume_and_verify_ignore_other_files(tmp_path):
+    saver = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test")
+    saver.save_records([make_record(i) for i in range(2)])
+    saver.close()
+    (tmp_path / "test_backup.jsonl").write_bytes((tmp_path / "test_001.jsonl").read_bytes())
+
+    resumed = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test")
+    assert resumed.total_records_saved == 2
+    scrape_all_profiles.verify_jsonl_integrity(tmp_path, "test", resumed.total_records_saved)
+
+
+def test_saver_never_overwrites_existing_files(tmp_path):
+    (tmp_path / "test_001.jsonl").write_bytes(b"")
+    with pytest.raises(FileExistsError):
+        scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", resume=False)
+
+
+def test_batch_settings_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", chunk_size=0)
+    with pytest.raises(ValueError):
+        scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test", flush_every=0)
+    saver = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test")
+    with pytest.raises(ValueError):
+        asyncio.run(scrape_all_profiles.scrape_profiles_in_batches([make_profile(0)], saver, batch_size=0))
+    assert not any(tmp_path.iterdir())
+
+
+def test_failed_profiles_keep_pairing(tmp_path, monkeypatch):
+    async def scrape_profile(urls, **kwargs):
+        # the second profile of every batch fails
+        return [None if index == 1 else {"url": url} for index, url in enumerate(urls)]
+
+    monkeypatch.setattr(linkedin, "scrape_profile", scrape_profile)
+    saver = scrape_all_profiles.IncrementalJSONLSaver(tmp_path, prefix="test")
+    profiles = [make_profile(i) for i in range(6)]
+    saved = asyncio.run(scrape_all_profiles.scrape_profiles_in_batches(profiles, saver, batch_size=3))
+    saver.close()
+
+    assert saved == 4
+    for line in read_lines(tmp_path / "test_001.jsonl"):
+        record = scrape_all_profiles.RECORD_DECODER.decode(line)
+        assert record.scraped_data["url"] == record.original_profile.linkedin_url
+    assert saver.seen_urls == {profiles[i].linkedin_url for i in (0, 2, 3, 5)}
@@ -1,6 +1,36 @@
+import dataclasses
 import json
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder when orjson is not installed
+    orjson = None
+
+
+def _json_default(obj):
+    """Serialize dataclasses for the stdlib json fallback, orjson handles them natively."""
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps_json(obj, indent=False) -> bytes:
+    """Serialize an object to UTF-8 encoded JSON bytes.
+
+    Uses orjson when available and falls back to the stdlib json module.
+
+    Parameters
+    ----------
+    obj : object
+        Object to serialize.
+    indent : bool, optional
+        Pretty-print with 2-space indentation, by default False.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False, default=_json_default).encode("utf-8")
+
 
 def save_jsonl(records, output_dir, prefix="chunk", chunk_size=100000):
     """Save list of records to JSONL files.
@@ -20,18 +50,7 @@ def save_jsonl(records, output_dir, prefix="chunk", chunk_size=100000):
     output_dir.mkdir(parents=True, exist_ok=True)
 
     total = len(records)
-    if total == 0:
-        return
-
-    if total > chunk_size:
-        for index in range(0, total, chunk_size):
-            chunk_records = records[index : index + chunk_size]
-            chunk_path = output_dir / f"{prefix}_{index // chunk_size + 1:03d}.jsonl"
-            with open(chunk_path, "w", encoding="utf-8") as f:
-                for record in chunk_records:
-                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
-    else:
-        chunk_path = output_dir / f"{prefix}_001.jsonl"
-        with open(chunk_path, "w", encoding="utf-8") as f:
-            for record in records:
-                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    for index in range(0, total, chunk_size):
+        chunk_path = output_dir / f"{prefix}_{index // chunk_size + 1:03d}.jsonl"
+        with open(chunk_path, "wb") as f:
+            f.writelines(dumps_json(records[i]) + b"\n" for i in range(index, min(index + chunk_size, total)))